@@ -28,13 +28,23 @@ Overall Project Scenario:
 
 """
 # Imports
-from bs4 import BeautifulSoup
-from datetime import datetime
+from selectolax.lexbor import LexborHTMLParser
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pa_csv
 import sqlite3
+import duckdb
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import io
 import os
+import time
+import re
+import atexit
+import functools
+from concurrent.futures import ThreadPoolExecutor
 
 # settings
 pd.set_option('display.max_columns', None)
@@ -45,27 +55,100 @@ data_url = "https://web.archive.org/web/20230908091635/https://en.wikipedia.org/
 csv_url = "https://cf-courses-data.s3.us.cloud-object-storage.appdomain.cloud/IBMSkillsNetwork-PY0221EN-Coursera/labs/v2/exchange_rate.csv"
 csv_path = "./exchange_rate.csv"
 table_attributes = ["Name", "MC_USD_Billion"]
+exchange_currencies = ["GBP", "EUR", "INR"]
+mc_usd_pattern = re.compile(r'\d[\d,]*(?:\.\d+)?')  # numeric part of a market cap cell, e.g. "$1,234.56[a]"
 output_csv_path = "./Largest_banks_data.csv"
 db = "Banks.db"
+analytics_db = "Banks.duckdb"
 table = "Largest_banks"
 log_file = "code_log.txt"
+timestamp_format = '%Y-%b-%d-%H:%M:%S'  # Year-Monthname-Day-Hour-Minute-Second
+
+# Shared HTTP session, both downloads reuse its keep-alive connections and retry transient failures
+session = requests.Session()
+session.mount('https://', HTTPAdapter(max_retries=Retry(total=3, backoff_factor=0.3,
+                                                        status_forcelist=(500, 502, 503, 504))))
 
 def download_exchange_rate_csv(url, local_filename):
     """
-    Downloads the exchange rate CSV file from the given URL and saves it locally.
+    Downloads the exchange rate CSV file from the given URL, saves a local copy
+    and returns the rates parsed straight from the downloaded bytes.
+
+    The ETag of the last download is kept next to the local copy (<local_filename>.etag)
+    and sent back as If-None-Match, so an unchanged file is not transferred again
+    and the local copy is used instead.
+
+    :param url:
+    :param local_filename:
+    :return: dict with "Currency" as keys and "Rate" as values
     """
     try:
         log_progress("Downloading exchange rate CSV file started")
-        response = requests.get(url)
+        etag_path = local_filename + ".etag"
+        headers = {}
+        if os.path.exists(local_filename) and os.path.exists(etag_path):
+            with open(etag_path, 'r') as f:
+                headers['If-None-Match'] = f.read().strip()
+        response = session.get(url, headers=headers, timeout=30)
         response.raise_for_status()
+
+        if response.status_code == 304:
+            exchange_rates = read_exchange_rates(local_filename, os.path.getmtime(local_filename))
+            log_progress("Exchange rate CSV file not modified, using the local copy")
+            return exchange_rates
+
+        # Keep the local copy, but parse the in-memory buffer rather than reading it back
         with open(local_filename, 'wb') as f:
             f.write(response.content)
+        etag = response.headers.get('ETag')
+        if etag:
+            with open(etag_path, 'w') as f:
+                f.write(etag)
+        elif os.path.exists(etag_path):
+            # A stale ETag would no longer describe the new local copy
+            os.remove(etag_path)
+        exchange_rates = pd.read_csv(io.BytesIO(response.content)).set_index("Currency")["Rate"].to_dict()
         log_progress("Downloading exchange rate CSV file completed")
+        return exchange_rates
     except Exception as e:
         log_progress(f"Downloading exchange rate CSV file failed: {e}")
         raise
 
+def download_page(url):
+    """
+    Downloads the webpage at the given URL and returns its HTML text.
+
+    :param url:
+    :return: str
+    """
+    try:
+        log_progress("Downloading webpage started")
+        response = session.get(url, timeout=30)
+        response.raise_for_status()
+        log_progress("Downloading webpage completed")
+        return response.text
+    except Exception as e:
+        log_progress(f"Downloading webpage failed: {e}")
+        raise
+
+@functools.lru_cache(maxsize=1)
+def read_exchange_rates(csv_path, mtime):
+    """
+    Reads the exchange rates from the local CSV file. The result is cached
+    on the file's modification time, so the file is only parsed again
+    after it has changed.
+
+    :param csv_path:
+    :param mtime: os.path.getmtime(csv_path), used as the cache key
+    :return: dict with "Currency" as keys and "Rate" as values
+    """
+    return pd.read_csv(csv_path).set_index("Currency")["Rate"].to_dict()
+
 # Task 1: Logging Function
+# Opened once and line-buffered, so each message is one write instead of an open/close pair
+log_handle = open(log_file, "a", buffering=1)
+atexit.register(log_handle.close)
+
 def log_progress(message):
     """
     Logs the progress of the code at different stages in code_log.txt
@@ -73,72 +156,68 @@ def log_progress(message):
     :param message:
     :return: None
     """
-    timestamp_format = '%Y-%b-%d-%H:%M:%S'  # Year-Monthname-Day-Hour-Minute-Second
-    now = datetime.now()  # get current timestamp
-    timestamp = now.strftime(timestamp_format)
-    with open(log_file, "a") as f:
-        f.write(timestamp + ' : ' + message + '\n')
+    # time.strftime formats the current local time without building a datetime object
+    log_handle.write(f"{time.strftime(timestamp_format)} : {message}\n")
 
 # Task 2: Data Extraction
-def extract(data_url, table_attributes):
+def extract(page, table_attributes):
     """
-    Extracts the tabular information from the given URL under the heading
-    "By market capitalization" and saves it to a dataframe.
+    Extracts the tabular information from the given webpage HTML under the
+    heading "By market capitalization" and saves it to a dataframe.
 
-    :param data_url:
+    :param page: HTML text of the webpage, see download_page
     :param table_attributes:
     :return: df
     """
     log_progress("Data extraction started")
     try:
-        # Fetch the webpage content
-        page = requests.get(data_url).text
-        data = BeautifulSoup(page, 'html.parser')
+        # Parse with selectolax (lexbor), only CSS selection is needed on the tree
+        tree = LexborHTMLParser(page)
 
-        # Initialize the dataframe
-        df = pd.DataFrame(columns=table_attributes)
+        # Collect the parsed rows, the dataframe is built once at the end
+        rows = []
 
-        # Find all 'tbody' elements
-        table_bodies = data.find_all('tbody')
-        if not table_bodies:
-            raise ValueError("No table bodies found on the webpage.")
+        # Assume the first wikitable contains the required table
+        target_table = tree.css_first('table.wikitable')
+        if target_table is None:
+            raise ValueError("No wikitable found on the webpage.")
 
-        # Assume the first 'tbody' contains the required table
-        target_table_body = table_bodies[0]
-        table_rows = target_table_body.find_all('tr')
+        # Select the data rows (rows with 'td' cells) in one query
+        table_rows = target_table.css('tr:has(td)')
+        if not table_rows:
+            raise ValueError("No table rows found on the webpage.")
 
         # Iterate over each row in the table
         for row in table_rows:
             try:
                 # Find all 'td' elements in the row
-                columns = row.find_all('td')
-                if len(columns) != 0:
-                    # Extract the bank name
-                    name_cell = columns[1]
-                    name_links = name_cell.find_all('a')
-                    if len(name_links) >= 2:
-                        bank_name = name_links[1]['title']
-                    else:
-                        bank_name = name_cell.get_text(strip=True)
-
-                    # Extract the market capitalization in USD billion
-                    mc_usd_text = columns[2].get_text(strip=True)
-                    # Remove any trailing non-digit characters
-                    while mc_usd_text and not mc_usd_text[-1].isdigit():
-                        mc_usd_text = mc_usd_text[:-1]
-                    mc_usd = float(mc_usd_text.replace(',', '').replace('$', ''))
-
-                    # Create a data dictionary
-                    data_dict = {"Name": bank_name, "MC_USD_Billion": mc_usd}
-
-                    # Create a temporary dataframe and concatenate it
-                    df_temp = pd.DataFrame(data_dict, index=[0])
-                    df = pd.concat([df, df_temp], ignore_index=True)
+                columns = row.css('td')
+
+                # Extract the bank name
+                name_cell = columns[1]
+                name_links = name_cell.css('a')
+                if len(name_links) >= 2:
+                    bank_name = name_links[1].attributes['title']
+                else:
+                    bank_name = name_cell.text(strip=True)
+
+                # Extract the market capitalization in USD billion
+                mc_usd_text = columns[2].text()
+                mc_usd_match = mc_usd_pattern.search(mc_usd_text)
+                if mc_usd_match is None:
+                    raise ValueError(f"No market capitalization found in {mc_usd_text.strip()!r}")
+                mc_usd = float(mc_usd_match.group().replace(',', ''))
+
+                rows.append((bank_name, mc_usd))
             except Exception as e:
                 # Log any exceptions and continue
                 log_progress(f"Row parsing error: {e}")
                 continue
 
+        # Build the dataframe in one shot
+        df = pd.DataFrame(rows, columns=table_attributes)
+        df["MC_USD_Billion"] = df["MC_USD_Billion"].astype(np.float64)
+
         log_progress("Data extraction completed")
         return df
 
@@ -147,28 +226,32 @@ def extract(data_url, table_attributes):
         raise
 
 # Task 3: Data Transformation
-def transform(df):
+def transform(df, exchange_rates=None):
     """
     Transform adds columns for market capitalization in GBP, EUR, and INR
     rounded to 2 decimal places based on the exchange rate information.
 
     :param df:
+    :param exchange_rates: dict with "Currency" as keys and "Rate" as values,
+        read from the local exchange rate CSV file when not given
     :return: df
     """
     log_progress("Data transformation started")
     try:
-        # Read exchange rates from local CSV file
-        exchange_rate_df = pd.read_csv(csv_path)
-        # Convert to a dictionary with "Currency" as keys and "Rate" as values
-        exchange_rates = exchange_rate_df.set_index("Currency").to_dict()["Rate"]
+        if exchange_rates is None:
+            exchange_rates = read_exchange_rates(csv_path, os.path.getmtime(csv_path))
+
+        # Get the USD values as a contiguous float64 array
+        usd = df["MC_USD_Billion"].to_numpy(dtype=np.float64, copy=False)
 
-        # Ensure 'MC_USD_Billion' is of type float
-        df['MC_USD_Billion'] = df['MC_USD_Billion'].astype(float)
+        # Broadcast the USD column against all rates at once, one (rows x currencies) array.
+        # Kept in float64: float32 has ~7 significant digits, not enough for INR values to the cent.
+        rates = np.array([exchange_rates[c] for c in exchange_currencies], dtype=np.float64)
+        converted = usd[:, None] * rates
+        np.round(converted, 2, out=converted)  # round in place, no second temporary
 
-        # Adds MC_GBP_Billion, MC_EUR_Billion, and MC_INR_Billion columns and round to 2 decimals
-        df["MC_GBP_Billion"] = [np.round(x * exchange_rates["GBP"], 2) for x in df["MC_USD_Billion"]]
-        df["MC_EUR_Billion"] = [np.round(x * exchange_rates["EUR"], 2) for x in df["MC_USD_Billion"]]
-        df["MC_INR_Billion"] = [np.round(x * exchange_rates["INR"], 2) for x in df["MC_USD_Billion"]]
+        # Adds MC_GBP_Billion, MC_EUR_Billion, and MC_INR_Billion columns in a single assignment
+        df[[f"MC_{c}_Billion" for c in exchange_currencies]] = converted
 
         log_progress("Data transformation completed")
         return df
@@ -189,7 +272,9 @@ def load_to_csv(df, csv_path):
     """
     log_progress("Data loading to CSV started")
     try:
-        df.to_csv(csv_path, index=False)
+        # Serialize through Arrow's C++ CSV writer instead of pandas' Python one.
+        # Text values are always quoted by Arrow, the file reads back identically.
+        pa_csv.write_csv(pa.Table.from_pandas(df, preserve_index=False), csv_path)
         log_progress("Data loading to CSV completed")
     except Exception as e:
         log_progress(f"Data loading to CSV failed: {e}")
@@ -208,13 +293,86 @@ def load_to_db(df, sql_connection, table):
     """
     log_progress("Data loading to database started")
     try:
-        df.to_sql(table, sql_connection, if_exists='replace', index=False)
+        # Insert rows in multi-row VALUES batches, keeping each statement under
+        # SQLite's conservative 999 bound parameter limit
+        chunksize = max(1, 999 // len(df.columns))
+        # Open the transaction explicitly so the drop and create don't autocommit on their own
+        with sql_connection:
+            sql_connection.execute("BEGIN")
+            df.to_sql(table, sql_connection, if_exists='replace', index=False,
+                      method='multi', chunksize=chunksize)
         log_progress("Data loading to database completed")
     except Exception as e:
         log_progress(f"Data loading to database failed: {e}")
         raise
 
+def save_db(sql_connection, db_path):
+    """
+    Save_db writes a snapshot of the (in-memory) SQLite database to the
+    input path with VACUUM INTO. The snapshot is written next to the
+    target first and then moved over it, so a failed save leaves the
+    previous file intact.
+
+    :param sql_connection:
+    :param db_path:
+    :return: None
+    """
+    log_progress("Saving database to disk started")
+    try:
+        # VACUUM INTO refuses to overwrite an existing file
+        tmp_path = db_path + ".tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        sql_connection.execute("VACUUM INTO ?", (tmp_path,))
+        os.replace(tmp_path, db_path)
+        log_progress("Saving database to disk completed")
+    except Exception as e:
+        log_progress(f"Saving database to disk failed: {e}")
+        raise
+
+def load_to_analytics_db(df, duckdb_connection, table):
+    """
+    Load_to_analytics_db saves the final dataframe as a DuckDB table
+    with the input name. The dataframe is registered as a view and
+    scanned in place, so no row-by-row inserts are issued.
+
+    :param df:
+    :param duckdb_connection:
+    :param table:
+    :return: None
+    """
+    log_progress("Data loading to analytics database started")
+    try:
+        duckdb_connection.register("largest_banks_df", df)
+        try:
+            duckdb_connection.execute(f"CREATE OR REPLACE TABLE {table} AS SELECT * FROM largest_banks_df")
+        finally:
+            duckdb_connection.unregister("largest_banks_df")
+        log_progress("Data loading to analytics database completed")
+    except Exception as e:
+        log_progress(f"Data loading to analytics database failed: {e}")
+        raise
+
 # Task 6: DB Querying
+def format_table(headers, rows):
+    """
+    Format_table lays out query result rows as aligned text columns,
+    numbers right-aligned and everything else left-aligned.
+
+    :param headers:
+    :param rows:
+    :return: str
+    """
+    cells = [[f"{value:.12g}" if isinstance(value, float) else str(value) for value in row] for row in rows]
+    numeric = [isinstance(value, (int, float)) for value in rows[0]] if rows else [False] * len(headers)
+    widths = [max(len(value) for value in column) for column in zip(headers, *cells)]
+
+    def format_line(values):
+        return '  '.join(value.rjust(width) if is_numeric else value.ljust(width)
+                         for value, width, is_numeric in zip(values, widths, numeric)).rstrip()
+
+    return '\n'.join(format_line(values) for values in [headers, *cells])
+
 def run_query(query, sql_connection):
     """
     Run_query runs the input query on the database table, then
@@ -227,8 +385,11 @@ def run_query(query, sql_connection):
     log_progress("Query execution started")
     try:
         print(query)
-        query_output = pd.read_sql(query, sql_connection)
-        print(query_output)
+        # The output is only printed, so read the rows off the cursor instead of
+        # building a dataframe (works for both sqlite3 and DuckDB connections)
+        cursor = sql_connection.execute(query)
+        headers = [column[0] for column in cursor.description]
+        print(format_table(headers, cursor.fetchall()))
         log_progress("Query execution completed")
     except Exception as e:
         log_progress(f"Query execution failed: {e}")
@@ -239,16 +400,20 @@ if __name__ == "__main__":
     # Clear previous log file contents
     open(log_file, 'w').close()
 
-    # Download the exchange_rate.csv file
-    download_exchange_rate_csv(csv_url, csv_path)
+    # Download the exchange_rate.csv file and the webpage concurrently, they are independent
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        exchange_rates_future = executor.submit(download_exchange_rate_csv, csv_url, csv_path)
+        page_future = executor.submit(download_page, data_url)
+        page = page_future.result()
+        exchange_rates = exchange_rates_future.result()
 
     # Task 2: Data Extraction
-    df = extract(data_url, table_attributes)
+    df = extract(page, table_attributes)
     print("Extracted Data:")
     print(df)
 
     # Task 3: Data Transformation
-    df = transform(df)
+    df = transform(df, exchange_rates)
     print("Transformed Data:")
     print(df)
 
@@ -256,25 +421,32 @@ if __name__ == "__main__":
     load_to_csv(df, output_csv_path)
 
     # Task 5: Data Loading (DB)
-    conn = sqlite3.connect(db)
+    # Build the database in memory and write it to disk in one go once loaded
+    conn = sqlite3.connect(':memory:')
     load_to_db(df, conn, table)
+    save_db(conn, db)
+
+    # The analytic queries below run on DuckDB, the SQLite table is kept for downstream consumers
+    analytics_conn = duckdb.connect(analytics_db)
+    load_to_analytics_db(df, analytics_conn, table)
 
     # Task 6: DB Querying
     query = f"SELECT * FROM {table}"
-    run_query(query, conn)
+    run_query(query, analytics_conn)
 
     # Query project/quiz
     query = f"SELECT AVG(MC_GBP_Billion) FROM {table}"
-    run_query(query, conn)
+    run_query(query, analytics_conn)
 
     query = f"SELECT Name from {table} LIMIT 5"
-    run_query(query, conn)
+    run_query(query, analytics_conn)
 
     # Additional queries (my own testing)
     query = f"SELECT Name, MC_USD_Billion FROM {table} ORDER BY MC_USD_Billion DESC LIMIT 1"
-    run_query(query, conn)
+    run_query(query, analytics_conn)
 
-    # Close the database connection
+    # Close the database connections
+    analytics_conn.close()
     conn.close()
 
     # Task 7: Logging Verification